@@ -0,0 +1,33 @@
+"""
+Numba kernels for the attenuation module.
+numba is an optional dependency, so this module is only
+imported by attenuation.py when a kernel is first needed.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def bulk_Q(fractions, Q_ratio, Q0fa, ag, QK, a):
+    """
+    Numba version of attenuation._bulk_Q_numpy for 2D fractions,
+    which evaluates all the terms in a single parallel loop.
+    """
+    n_points, n_materials = fractions.shape
+    QS_bulk = np.empty(n_points)
+    QK_bulk = np.empty(n_points)
+    alpha_bulk = np.empty(n_points)
+    for i in prange(n_points):
+        QS_i = 0.
+        QK_i = 0.
+        alpha_i = 0.
+        for j in range(n_materials):
+            f = fractions[i, j]
+            QS_i += f*Q0fa[j]*np.exp(ag[j]*Q_ratio[i])
+            QK_i += f*QK[j]
+            alpha_i += f*a[j]
+        QS_bulk[i] = QS_i
+        QK_bulk[i] = QK_i
+        alpha_bulk[i] = alpha_i
+    return QS_bulk, QK_bulk, alpha_bulk
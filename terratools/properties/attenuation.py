@@ -1,13 +1,69 @@
 import numpy as np
 from collections import namedtuple
 from .profiles import peridotite_solidus
-from copy import deepcopy
+
+# Minimum number of P-T points for which the numba kernel is used.
+# Importing numba and loading the cached kernel takes ~0.5 s,
+# while the kernel saves ~0.05 s per million points over NumPy,
+# so smaller arrays are faster with NumPy alone.
+_NUMBA_MIN_POINTS = 10000000
 
 AnelasticProperties = namedtuple('AnelasticProperties',
                                  ['V_P', 'V_S',
                                   'Q_S', 'Q_K', 'Q_P', 'T_solidus'])
 
 
+def _bulk_Q_numpy(fractions, Q_ratio, Q0fa, ag, QK, a):
+    """
+    Returns the bulk QS, QK and alpha as the fraction-weighted
+    sums of the values for each material.
+    The materials are along the last axis of fractions.
+    """
+    material_QS = Q0fa*np.exp(np.multiply.outer(Q_ratio, ag))
+    return (np.sum(fractions*material_QS, axis=-1),
+            fractions @ QK,
+            fractions @ a)
+
+
+# The numba kernel, loaded by _numba_kernel on first use.
+# False if numba is not installed.
+_bulk_Q_numba = None
+
+
+def _numba_kernel():
+    """
+    Returns the numba version of _bulk_Q_numpy, or None if numba
+    is not installed. numba is only imported on the first call.
+    """
+    global _bulk_Q_numba
+    if _bulk_Q_numba is None:
+        try:
+            from ._attenuation_numba import bulk_Q
+            _bulk_Q_numba = bulk_Q
+        except ImportError:
+            _bulk_Q_numba = False
+    if _bulk_Q_numba is False:
+        return None
+    return _bulk_Q_numba
+
+
+def _bulk_Q(fractions, Q_ratio, Q0fa, ag, QK, a):
+    """
+    Returns the bulk QS, QK and alpha, using numba
+    for large arrays of P-T points if it is installed.
+
+    Q_ratio is the solidus temperature divided by the
+    temperature used to calculate QS.
+    """
+    if (np.ndim(fractions) == 2 and len(fractions) >= _NUMBA_MIN_POINTS
+            and np.ndim(Q0fa) == 1 and _numba_kernel() is not None):
+        Q_ratio = np.broadcast_to(Q_ratio, fractions.shape[:1])
+        return _numba_kernel()(np.ascontiguousarray(fractions, dtype=float),
+                               np.ascontiguousarray(Q_ratio, dtype=float),
+                               Q0fa, ag, QK, a)
+    return _bulk_Q_numpy(fractions, Q_ratio, Q0fa, ag, QK, a)
+
+
 class AttenuationModelGoes(object):
     """
     This class implements the mantle seismic attenuation model
@@ -29,14 +85,46 @@ class AttenuationModelGoes(object):
             as a function of pressure and temperature.
         Q_models: List of dictionaries
             Parameters for the attenuation models - one for each material.
+            The parameters are copied into arrays when Q_models is set,
+            so to change them, assign a new list to Q_models rather
+            than modifying the dictionaries in place.
         """
         self.T_solidus_function = T_solidus_function
         self.model_mixing_function = model_mixing_function
         self.Q_models = Q_models
 
+    @property
+    def Q_models(self):
+        """
+        The list of parameter dictionaries for the attenuation models.
+        """
+        return self._Q_models
+
+    @Q_models.setter
+    def Q_models(self, Q_models):
+        # The model parameters are stored as arrays so that
+        # anelastic_properties does not need to look them up
+        # in the Q_models dictionaries on every call.
+        self._Q_models = Q_models
+        self._Q0 = np.array([Q_mod['Q0'] for Q_mod in Q_models],
+                            dtype=float)
+        self._a = np.array([Q_mod['a'] for Q_mod in Q_models],
+                           dtype=float)
+        self._ag = self._a*np.array([Q_mod['g'] for Q_mod in Q_models])
+        self._QK = np.array([Q_mod['QK'] for Q_mod in Q_models],
+                            dtype=float)
+
+    def _Q0fa(self, frequency):
+        """
+        Returns Q0*frequency^a for each material,
+        with the materials along the last axis.
+        """
+        return self._Q0*np.power(np.expand_dims(frequency, -1), self._a)
+
     def anelastic_properties(self, elastic_Vp, elastic_Vs,
                              pressure, temperature, frequency,
-                             dT_Q_constant_above_solidus=0):
+                             dT_Q_constant_above_solidus=0,
+                             T_solidus=None):
         """
         Calculates the anelastic Vp and Vs, QS, and QK
         according to the model used by Maguire et al., 2016.
@@ -77,58 +165,47 @@ class AttenuationModelGoes(object):
             The pressure in Pa
         temperature : float or numpy array
             The temperature in K
-        frequency: float
+        frequency: float or numpy array
             The frequency of the seismic waves in Hz
         dT_Q_constant_above_solidus: float
             if the temperature > (solidus temperature + dT),
             the value of QS, QK and a are frozen at the values
             corresponding to (solidus temperature + dT).
+        T_solidus: float or numpy array (optional)
+            The solidus temperature at the given pressure(s).
+            If provided, T_solidus_function is not called, which saves
+            recomputing the solidus when the same pressures are reused
+            (e.g. for several frequencies). The T_solidus attribute of
+            a previously returned AnelasticProperties can be used here.
 
         Returns
         -------
         An instance of an AnelasticProperties named tuple.
         Has the following attributes:
-        V_P, V_S, Q_S, Q_K, Q_P
+        V_P, V_S, Q_S, Q_K, Q_P, T_solidus
         """
 
         fractions = self.model_mixing_function(pressure, temperature)
+        Q0fa = self._Q0fa(frequency)
 
         try:
             pressure = float(pressure)
-            Tm = self.T_solidus_function(pressure)
+            Tm = (self.T_solidus_function(pressure) if T_solidus is None
+                  else float(T_solidus))
             # Freezes QS if above a certain temperature
             if dT_Q_constant_above_solidus < temperature - Tm:
                 Q_temperature = Tm + dT_Q_constant_above_solidus
             else:
-                Q_temperature = deepcopy(temperature)
-
-            QS = 0.
-            QK = 0.
-            alpha = 0.
-            for i, f in enumerate(fractions):
-                Q_mod = self.Q_models[i]
-                QS += f * (Q_mod['Q0'] *
-                           np.power(frequency, Q_mod['a']) *
-                           np.exp(Q_mod['a']*Q_mod['g']*Tm/Q_temperature))
-                QK += f * Q_mod['QK']
-                alpha += f * Q_mod['a']
+                Q_temperature = temperature
 
         except TypeError:
-            Q_temperature = deepcopy(temperature)
-            Tm = self.T_solidus_function(pressure)
-            idx = np.argwhere(temperature > Tm + dT_Q_constant_above_solidus)
-            Q_temperature[idx] = Tm[idx] + dT_Q_constant_above_solidus
-
-            QS = np.zeros_like(temperature)
-            QK = np.zeros_like(temperature)
-            alpha = np.zeros_like(temperature)
-            for i, f in enumerate(fractions.T):
-                Q_mod = self.Q_models[i]
-                QS += f * (Q_mod['Q0'] *
-                           np.power(frequency, Q_mod['a']) *
-                           np.exp(Q_mod['a']*Q_mod['g']*Tm/Q_temperature))
-                QK += f * Q_mod['QK']
-                alpha += f * Q_mod['a']
+            Tm = (self.T_solidus_function(pressure) if T_solidus is None
+                  else T_solidus)
+            Q_temperature = np.minimum(temperature,
+                                       Tm + dT_Q_constant_above_solidus)
+
+        QS, QK, alpha = _bulk_Q(fractions, Tm/Q_temperature,
+                                Q0fa, self._ag, self._QK, self._a)
 
         invQS = 1./QS
         invQK = 1./QK
@@ -143,12 +220,9 @@ class AttenuationModelGoes(object):
             else:
                 QP = 1./invQP
         except ValueError:
-            QP = np.zeros_like(temperature)
-            idx = np.argwhere(invQP <= 0.)
-            invQP[idx] = 0.
-            QP[idx] = np.inf
-            idx = np.argwhere(invQP > 0.)
-            QP[idx] = 1./invQP[idx]
+            invQP = np.maximum(invQP, 0.)
+            QP = np.divide(1., invQP, out=np.full_like(invQP, np.inf),
+                           where=invQP > 0.)
 
         anelastic_Vp = elastic_Vp*(1. - invQP/(2.*np.tan(np.pi*alpha/2.)))
         anelastic_Vs = elastic_Vs*(1. - invQS/(2.*np.tan(np.pi*alpha/2.)))
@@ -173,6 +247,8 @@ def mantle_domain_fractions(pressure, temperature):
     is at 11.1 GPa. At the same reference temperature, the center
     of the postspinel transition is at 26.1 GPa. Clapeyron slopes of
     2.4e6 Pa/K and -2.2e6 Pa/K are applied.
+    If the two transition regions overlap (at very high temperatures),
+    the fractions are still constrained to sum to one.
 
     Parameters
     ----------
@@ -183,11 +259,13 @@ def mantle_domain_fractions(pressure, temperature):
 
     Returns
     -------
-    fractions: 1D or 2D numpy array
+    fractions: numpy array
         An array containing the effective fractions of
-        upper mantle, transition zone and lower mantle material.
-        If 2D, the fractions[i,j] corresponds to the ith
-        P-T point and jth material.
+        upper mantle, transition zone and lower mantle material,
+        with shape (3,) for scalar inputs, or the broadcast shape of
+        pressure and temperature + (3,) for array inputs.
+        For example, for 1D inputs fractions[i,j] corresponds to
+        the ith P-T point and jth material.
     """
 
     P_smooth_halfwidth = 1.1e9
@@ -195,50 +273,15 @@ def mantle_domain_fractions(pressure, temperature):
     pressure_tztop = 11.1e9 + 2.4e6*(temperature - T_ref)
     pressure_tzbase = 26.1e9 - 2.2e6*(temperature - T_ref)
 
-    try:
-        fractions = np.zeros(3)
-        if pressure < pressure_tztop - P_smooth_halfwidth:
-            fractions[0] = 1.
-
-        elif pressure < pressure_tztop + P_smooth_halfwidth:
-            f = ((pressure - (pressure_tztop - P_smooth_halfwidth))
-                 / (2.*P_smooth_halfwidth))
-            fractions[:2] = [1. - f, f]
-
-        elif pressure < pressure_tzbase - P_smooth_halfwidth:
-            fractions[1] = 1.
-
-        elif pressure < pressure_tzbase + P_smooth_halfwidth:
-            f = ((pressure - (pressure_tzbase - P_smooth_halfwidth))
-                 / (2.*P_smooth_halfwidth))
-            fractions[1:] = [1. - f, f]
-
-        else:
-            fractions[2] = 1.
-    except ValueError:
-        fractions = np.zeros((len(pressure), 3))
-
-        f_umtz = ((pressure - (pressure_tztop - P_smooth_halfwidth))
-                  / (2.*P_smooth_halfwidth))
-        f_tzlm = ((pressure - (pressure_tzbase - P_smooth_halfwidth))
-                  / (2.*P_smooth_halfwidth))
-
-        um_idx = np.argwhere(f_umtz <= 0.)
-        umtz_idx = np.argwhere(np.all([f_umtz >= 0., f_umtz <= 1.],
-                                      axis=0)).T[0]
-        tz_idx = np.argwhere(np.all([f_umtz >= 1., f_tzlm <= 0.],
-                                    axis=0)).T[0]
-        tzlm_idx = np.argwhere(np.all([f_tzlm >= 0., f_tzlm <= 1.],
-                                      axis=0)).T[0]
-        lm_idx = np.argwhere(f_tzlm >= 1.)
-
-        fractions[um_idx, 0] = 1.
-        fractions[umtz_idx, :2] = np.array([1. - f_umtz[umtz_idx],
-                                            f_umtz[umtz_idx]]).T
-        fractions[tz_idx, 1] = 1.
-        fractions[tzlm_idx, 1:] = np.array([1. - f_tzlm[tzlm_idx],
-                                            f_tzlm[tzlm_idx]]).T
-        fractions[lm_idx, 2] = 1.
+    # Fractions of the way through the UM-TZ and TZ-LM transitions
+    f_umtz = np.clip((pressure - (pressure_tztop - P_smooth_halfwidth))
+                     / (2.*P_smooth_halfwidth), 0., 1.)
+    f_tzlm = np.clip((pressure - (pressure_tzbase - P_smooth_halfwidth))
+                     / (2.*P_smooth_halfwidth), 0., 1.)
+
+    fractions = np.stack([1. - f_umtz,
+                          f_umtz*(1. - f_tzlm),
+                          f_umtz*f_tzlm], axis=-1)
 
     return fractions
 
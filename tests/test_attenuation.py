@@ -1,6 +1,16 @@
 import unittest
 import numpy as np
+from copy import deepcopy
 from terratools.properties.attenuation import Q7g
+from terratools.properties.attenuation import AttenuationModelGoes
+from terratools.properties.attenuation import mantle_domain_fractions
+from terratools.properties.attenuation import _bulk_Q_numpy
+from terratools.properties.profiles import peridotite_solidus
+
+try:
+    from terratools.properties._attenuation_numba import bulk_Q
+except ImportError:
+    bulk_Q = None
 
 
 class TestAttenuation(unittest.TestCase):
@@ -22,6 +32,94 @@ class TestAttenuation(unittest.TestCase):
         self.assertTrue(p0.Q_K[1] == 1.e3)
         self.assertTrue(p0.Q_S[0] != p0.Q_S[1])
 
+    def test_Goes_attenuation_precomputed_solidus(self):
+        pressure = np.array([10.e9, 20.e9])
+        temperature = np.array([1500., 1600.])
+        p0 = Q7g.anelastic_properties(elastic_Vp=1.,
+                                      elastic_Vs=0.5,
+                                      pressure=pressure,
+                                      temperature=temperature,
+                                      frequency=1.)
+        p1 = Q7g.anelastic_properties(elastic_Vp=1.,
+                                      elastic_Vs=0.5,
+                                      pressure=pressure,
+                                      temperature=temperature,
+                                      frequency=1.,
+                                      T_solidus=p0.T_solidus)
+        self.assertTrue(np.all(p0.Q_S == p1.Q_S))
+        self.assertTrue(np.all(p0.V_P == p1.V_P))
+
+    def test_Goes_attenuation_frequency_array(self):
+        p0 = Q7g.anelastic_properties(elastic_Vp=1.,
+                                      elastic_Vs=1.,
+                                      pressure=np.array([10.e9, 20.e9]),
+                                      temperature=np.array([1500., 1600.]),
+                                      frequency=np.array([1., 2.]))
+        p1 = Q7g.anelastic_properties(elastic_Vp=1.,
+                                      elastic_Vs=1.,
+                                      pressure=20.e9,
+                                      temperature=1600.,
+                                      frequency=2.)
+        self.assertAlmostEqual(p0.Q_S[1], p1.Q_S)
+
+    def test_Goes_attenuation_set_Q_models(self):
+        model = AttenuationModelGoes(peridotite_solidus,
+                                     mantle_domain_fractions,
+                                     Q_models=deepcopy(Q7g.Q_models))
+        Q_models = deepcopy(model.Q_models)
+        for Q_mod in Q_models:
+            Q_mod['QK'] = 500.
+        model.Q_models = Q_models
+        p0 = model.anelastic_properties(elastic_Vp=1.,
+                                        elastic_Vs=1.,
+                                        pressure=10.e9,
+                                        temperature=1500.,
+                                        frequency=1.)
+        self.assertAlmostEqual(p0.Q_K, 500.)
+
+    @unittest.skipIf(bulk_Q is None, 'numba is not installed')
+    def test_bulk_Q_numba_matches_numpy(self):
+        rng = np.random.default_rng(0)
+        fractions = rng.dirichlet([1., 1., 1.], 1000)
+        Q_ratio = rng.uniform(0.5, 3., 1000)
+        args = (fractions, Q_ratio, Q7g._Q0, Q7g._ag, Q7g._QK, Q7g._a)
+        for Q_numba, Q_numpy in zip(bulk_Q(*args), _bulk_Q_numpy(*args)):
+            self.assertEqual(Q_numpy.shape, (1000,))
+            np.testing.assert_allclose(Q_numba, Q_numpy, rtol=1.e-12)
+
+    def test_mantle_domain_fractions_regimes(self):
+        # (P, T, expected fractions) in each of the five regimes
+        # (UM, UM-TZ, TZ, TZ-LM, LM) at two temperatures
+        points = [(5.e9, 750., [1., 0., 0.]),
+                  (10.55e9, 750., [0.75, 0.25, 0.]),
+                  (11.1e9, 750., [0.5, 0.5, 0.]),
+                  (18.e9, 750., [0., 1., 0.]),
+                  (26.1e9, 750., [0., 0.5, 0.5]),
+                  (40.e9, 750., [0., 0., 1.]),
+                  (10.e9, 1750., [1., 0., 0.]),
+                  (13.5e9, 1750., [0.5, 0.5, 0.]),
+                  (20.e9, 1750., [0., 1., 0.]),
+                  (23.35e9, 1750., [0., 0.75, 0.25]),
+                  (30.e9, 1750., [0., 0., 1.])]
+        pressure, temperature, expected = (np.array(x) for x in
+                                           zip(*points))
+        fractions = mantle_domain_fractions(pressure, temperature)
+        self.assertEqual(fractions.shape, (len(points), 3))
+        np.testing.assert_allclose(fractions, expected, atol=1.e-12)
+        for P, T, f in zip(pressure, temperature, fractions):
+            np.testing.assert_allclose(mantle_domain_fractions(P, T), f,
+                                       rtol=1.e-12)
+
+    def test_mantle_domain_fractions_overlap(self):
+        # The transition regions overlap above ~3530 K
+        pressure, temperature = np.meshgrid(np.linspace(17.e9, 21.e9, 41),
+                                            np.linspace(3600., 4000., 5))
+        fractions = mantle_domain_fractions(pressure, temperature)
+        self.assertEqual(fractions.shape, pressure.shape + (3,))
+        np.testing.assert_allclose(np.sum(fractions, axis=-1), 1.)
+        self.assertTrue(np.all(fractions >= 0.))
+        self.assertTrue(np.any(np.all(fractions > 0., axis=-1)))
+
 
 if __name__ == '__main__':
     unittest.main()